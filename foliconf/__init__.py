@@ -1,88 +1,139 @@
 import ast
+import functools
 import importlib.util
 import json
-import subprocess
+import os
 import sys
-from collections import defaultdict, namedtuple
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from numpydoc.docscrape import NumpyDocString
 
+def _recursive_creative_setattr(o, keys, default, value):
+    for k in keys[:-1]:
+        if not hasattr(o, k):
+            setattr(o, k, default())
+        o = getattr(o, k)
+    setattr(o, keys[-1], value)
 
-def _recursive_dd():
-    return defaultdict(_recursive_dd)
 
+def _recursive_getattr(o, keys):
+    for k in keys:
+        o = getattr(o, k)
+    return o
 
-def _recursive_dd_get(d, keys):
-    return _recursive_dd_get(d[keys[0]], keys[1:]) if len(keys) else d
 
+@functools.lru_cache(maxsize=None)
+def _parse_numpy_doc(doc: str):
+    # numpydoc is only needed to generate stubs, so don't make importing foliconf pay for it
+    from numpydoc.docscrape import NumpyDocString
 
-def _recursive_creative_setattr(o, keys, default, value):
-    if len(keys) == 1:
-        setattr(o, keys[0], value)
-        return
-    if not hasattr(o, keys[0]):
-        setattr(o, keys[0], default())
-    _recursive_creative_setattr(getattr(o, keys[0]), keys[1:], default, value)
+    return NumpyDocString(doc)
 
 
-def _recursive_getattr(o, keys):
-    if len(keys) == 1:
-        return getattr(o, keys[0])
-    return _recursive_getattr(getattr(o, keys[0]), keys[1:])
+@functools.lru_cache(maxsize=None)
+def _attribute_docstrings(doc: str) -> Dict[str, str]:
+    return {doc_attr.name: "\n".join(doc_attr.desc) for doc_attr in _parse_numpy_doc(doc)["Attributes"]}
 
 
-def get_typing_imports(ann: Any) -> List[str]:
-    if hasattr(ann, "__origin__"):
-        origin = ann.__origin__
-        if origin is Union:
-            args = ann.__args__
-            return (["Optional"] if type(None) in args and len(args) == 2 else ["Union"]) + sum(
-                [get_typing_imports(arg) for arg in args], []
-            )
-        elif origin is Dict:
-            args = ann.__args__
-            return ["Dict"] + get_typing_imports(args[0]) + get_typing_imports(args[1])
-        else:
-            elements = ann.__args__
-            ann_import = [origin.__name__] if origin.__module__ != "builtins" else []
-            return ann_import + sum([get_typing_imports(e) for e in elements], [])
-    elif ann is Any:
-        return ["Any"]
-    return []
+# Snapshots of what a class defines, by (class, kind). They are taken on first use rather than in config_class, since
+# decorators applied after it (e.g. dataclass) may still change the class, and are all dropped whenever config_class or
+# set_Config runs. A snapshot is thus only stale if a class is modified after it was used and before the next
+# registration: attributes added in between are not seen by config_to_dict and check_config until then.
+_class_snapshots: Dict[Tuple[type, str], Any] = {}
 
 
-def type_to_code_str(typing_instance: Any) -> str:
-    if hasattr(typing_instance, "__origin__"):
-        origin = typing_instance.__origin__
-        if origin is Union:
-            args = typing_instance.__args__
-            which = "Optional" if type(None) in args and len(args) == 2 else "Union"
-            str_ann = (
-                f"{which}["
-                + ", ".join([type_to_code_str(arg) for arg in args if which == "Union" or arg is not type(None)])
-                + "]"
-            )
-        elif origin is Dict:
-            key, value = typing_instance.__args__
-            str_ann = f"Dict[{type_to_code_str(key)}, {type_to_code_str(value)}]"
-        elif origin is Any:
-            str_ann = "Any"
-        else:
-            elements = typing_instance.__args__
-            str_ann = origin.__name__ + "[" + ", ".join([type_to_code_str(e) for e in elements]) + "]"
-    elif typing_instance is type(None):
-        str_ann = "None"
-    elif hasattr(typing_instance, "_name"):
-        str_ann = typing_instance._name
-    else:
-        str_ann = typing_instance.__name__
+def _snapshot(cls: type, kind: str, compute: Callable[[type], Any]) -> Any:
+    key = (cls, kind)
+    value = _class_snapshots.get(key)
+    if value is None:
+        value = _class_snapshots[key] = compute(cls)
+    return value
+
+
+def _public_attr_names(cls: type) -> Tuple[str, ...]:
+    return _snapshot(cls, "public_attrs", lambda c: tuple(a for a in dir(c) if not a.startswith("__")))
+
+
+def _annotations(cls: type) -> Tuple[Tuple[str, Any], ...]:
+    return _snapshot(cls, "annotations", lambda c: tuple(getattr(c, "__annotations__", {}).items()))
+
+
+def _present_attr_names(o: Any) -> set:
+    # Equivalent to filtering dir(o), without re-walking the class namespace every time
+    return {*_public_attr_names(type(o)), *getattr(o, "__dict__", ())}
+
+
+def get_typing_imports(ann: Any) -> List[str]:
+    out: List[str] = []
+    _annotation_to_code(ann, out.append)
+    return out
 
-    return str_ann
 
+def type_to_code_str(typing_instance: Any) -> str:
+    return _annotation_to_code(typing_instance, lambda name: None)
+
+
+def _annotation_to_code(ann: Any, add_import: Callable[[str], Any]) -> str:
+    """Returns the code string of a type annotation, calling `add_import` with each name it needs from `typing`"""
+    origin = getattr(ann, "__origin__", None)
+    if origin is not None:
+        handler = _ORIGIN_HANDLERS.get(origin)
+        if handler is not None:
+            return handler(ann, add_import)
+        if origin.__module__ != "builtins":
+            add_import(origin.__name__)
+        return origin.__name__ + "[" + ", ".join([_annotation_to_code(e, add_import) for e in ann.__args__]) + "]"
+    if ann is Any:
+        add_import("Any")
+    if ann is type(None):
+        return "None"
+    if ann is Ellipsis:
+        return "..."  # e.g. Tuple[int, ...] or Callable[..., int]
+    name = getattr(ann, "_name", None)
+    if name is not None:
+        return name
+    name = getattr(ann, "__name__", None)
+    if name is not None:
+        return name
+    # Not a type, e.g. the values of a Literal
+    return repr(ann)
+
+
+def _union_to_code(ann: Any, add_import: Callable[[str], Any]) -> str:
+    args = ann.__args__
+    which = "Optional" if type(None) in args and len(args) == 2 else "Union"
+    add_import(which)
+    shown = [_annotation_to_code(arg, add_import) for arg in args if which == "Union" or arg is not type(None)]
+    return f"{which}[" + ", ".join(shown) + "]"
+
+
+def _dict_to_code(ann: Any, add_import: Callable[[str], Any]) -> str:
+    key, value = ann.__args__
+    add_import("Dict")
+    return f"Dict[{_annotation_to_code(key, add_import)}, {_annotation_to_code(value, add_import)}]"
+
+
+_ORIGIN_HANDLERS: Dict[Any, Callable[[Any, Callable[[str], Any]], str]] = {
+    Union: _union_to_code,
+    Dict: _dict_to_code,
+    Any: lambda ann, add_import: "Any",
+}
+
+
+class ConfigAttr:
+    # Immutable, since StubMaker shares one instance between all attributes with the same type and docstring
+    __slots__ = ("type", "docstring")
+
+    def __init__(self, type: str, docstring: str):
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "docstring", docstring)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ConfigAttr is immutable, cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ConfigAttr is immutable, cannot delete {name}")
 
-ConfigAttr = namedtuple("ConfigAttr", ["type", "docstring"])
 
 DISCLAIMER = """# This file was generated automatically
 # Do not edit by hand, your changes will be lost
@@ -114,88 +165,230 @@ set_Config(Config)
 """
 
 
+# Bump this whenever the way modules are scanned changes, so that stale cache entries are ignored
+SCAN_CACHE_VERSION = 4
+SCAN_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "foliconf"
+
+
+def default_scan_cache_path(repo: str) -> Path:
+    """Each repository gets its own cache file, so that scanning one doesn't rewrite the entries of all the others"""
+    import hashlib
+
+    return SCAN_CACHE_DIR / f"scan-{hashlib.sha1(str(repo).encode()).hexdigest()[:16]}.json"  # nosec - not security
+
+
 class StubMaker(ast.NodeVisitor):
-    def __init__(self, base_path: str, verbose: bool):
-        self.config = _recursive_dd()
+    def __init__(self, base_path: str, verbose: bool, scan_cache_path: Optional[Path] = None):
+        # Attributes of all config classes, keyed by their full dotted name
+        self.config: Dict[str, ConfigAttr] = {}
+        # Many attributes share the same type and docstring (e.g. ("int", "")), so identical ConfigAttrs are shared
+        self._config_attrs: Dict[Tuple[str, str], ConfigAttr] = {}
         self._base_path = base_path
         self._verbose = verbose
+        self._loaded_paths: set[Path] = set()
+        self._scan_cache_path = scan_cache_path
+        self._scan_cache = self._load_scan_cache()
+        # Only the files scanned in this run are written back, so entries of deleted files don't linger
+        self._new_scan_cache: Dict[str, list] = {}
+        # Modules seen by scan_module, by module name: their path, whether they define config classes, and the
+        # modules they import
+        self._scanned: Dict[str, Tuple[Path, bool, List[str]]] = {}
 
     def start_module(self, path, local_path):
         self._mod_path = path
         self._local_mod_path = Path(local_path)
         self._should_import = False
+        self._found_configs: List[str] = []
+        self._found_imports: List[str] = []
+
+    def scan_module(self, path, local_path):
+        """Visits a module to find its config classes and imports, without importing it; modules that define config
+        classes are imported by `finalize_all`. The AST is only parsed if the file changed since it was last scanned,
+        otherwise what was found back then is reused."""
+        self.start_module(path, local_path)
+        stat = os.stat(path)
+        key = str(path)
+        entry = self._scan_cache.get(key)
+        if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+            for name in entry[2]:
+                self._found_config(name)
+            self._found_imports = entry[3]
+        else:
+            with open(path, "r") as f:
+                self.visit(ast.parse(f.read()))
+            entry = [stat.st_mtime_ns, stat.st_size, self._found_configs, self._found_imports]
+        self._new_scan_cache[key] = entry
+        self._scanned[self._module_name()] = (path, self._should_import, self._found_imports)
+
+    def finalize_all(self):
+        """Imports every scanned module that defines config classes, each exactly once. Scanned modules are ordered
+        so that a module's imports are executed before it, which avoids re-executing shared dependencies."""
+        order: List[str] = []
+        seen: set[str] = set()
+
+        def add_with_deps(module_name):
+            if module_name in seen or module_name not in self._scanned:
+                return
+            seen.add(module_name)
+            for dep in self._scanned[module_name][2]:
+                add_with_deps(dep)
+            order.append(module_name)
+
+        for module_name in self._scanned:
+            add_with_deps(module_name)
+        for module_name in order:
+            path, should_import, _ = self._scanned[module_name]
+            if should_import and path not in self._loaded_paths:
+                self._import_module(module_name, path)
+        self._scanned.clear()
+
+    def _load_scan_cache(self) -> Dict[str, list]:
+        if self._scan_cache_path is None:
+            return {}
+        try:
+            with open(self._scan_cache_path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(cache, dict) or cache.get("version") != SCAN_CACHE_VERSION:
+            return {}
+        files = cache.get("files")
+        if not isinstance(files, dict):
+            return {}
+        # A bad cache is ignored rather than trusted, entry by entry
+        return {path: entry for path, entry in files.items() if _is_valid_scan_entry(entry)}
+
+    def save_scan_cache(self):
+        if self._scan_cache_path is None:
+            return
+        import tempfile  # only needed here, keep it out of `import foliconf`
+
+        # The cache is only an optimization, failing to write it shouldn't prevent generating the stubs
+        tmp_path = None
+        try:
+            self._scan_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # A unique temporary name, so that concurrent runs don't write over each other's file before the replace
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self._scan_cache_path.parent, prefix=self._scan_cache_path.name, delete=False
+            ) as f:
+                tmp_path = f.name
+                json.dump({"version": SCAN_CACHE_VERSION, "files": self._new_scan_cache}, f)
+            os.replace(tmp_path, self._scan_cache_path)
+        except OSError as e:
+            print(f"Warning, could not write scan cache {self._scan_cache_path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _found_config(self, name):
+        if self._verbose:
+            print("Found config class", name)
+        self._found_configs.append(name)
+        self._should_import = True
+
+    def _module_name(self):
+        assert self._local_mod_path.suffix == ".py" and self._local_mod_path.parts[0] == "src"
+        if self._local_mod_path.name == "__init__.py":
+            # A package is imported (and named in other modules' imports) by its own name
+            return ".".join(self._local_mod_path.parts[1:-1])
+        return ".".join(self._local_mod_path.parts[1:-1]) + "." + self._local_mod_path.name[: -len(".py")]
 
     def finalize_module(self):
         if self._should_import:
-            assert self._local_mod_path.suffix == ".py" and self._local_mod_path.parts[0] == "src"
-            module_name = ".".join(self._local_mod_path.parts[1:-1]) + "." + self._local_mod_path.name[: -len(".py")]
-            if module_name in sys.modules:
-                # We've already imported this module because some other module imported it, no need to do it again
+            if self._mod_path in self._loaded_paths:
+                # Cheaper than rebuilding the module name to look it up in sys.modules
                 return
-            spec = importlib.util.spec_from_file_location(module_name, self._mod_path)
-            mod = importlib.util.module_from_spec(spec)
-            sys.modules[module_name] = mod
-            spec.loader.exec_module(mod)
+            self._import_module(self._module_name(), self._mod_path)
+
+    def _import_module(self, module_name, path):
+        if module_name in sys.modules:
+            # We've already imported this module because some other module imported it, no need to do it again
+            self._loaded_paths.add(path)
+            return
+        if path.name == "__init__.py":
+            spec = importlib.util.spec_from_file_location(
+                module_name, path, submodule_search_locations=[str(path.parent)]
+            )
+        else:
+            spec = importlib.util.spec_from_file_location(module_name, path)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = mod
+        spec.loader.exec_module(mod)
+        self._loaded_paths.add(path)
+
+    def _make_config_attr(self, type_name: str, docstring: str) -> ConfigAttr:
+        key = (type_name, docstring)
+        attr = self._config_attrs.get(key)
+        if attr is None:
+            attr = self._config_attrs[key] = ConfigAttr(type_name, docstring)
+        return attr
 
     def output_stub(self):
-        imports = []
-        typing_imports = []
+        imports: set[str] = set()
+        typing_imports: set[str] = set()
         for cname, cobj in _name_to_config.items():
             # We first extract possible docstrings for the attributes
-            docstrings = defaultdict(lambda: "")
-            if cobj.__doc__ is not None:
-                doc = NumpyDocString(cobj.__doc__)
-                for doc_attr in doc["Attributes"]:
-                    docstrings[doc_attr.name] = "\n".join(doc_attr.desc)
+            # (the parsed mapping is cached and shared, so it is only read from here)
+            docstrings = _attribute_docstrings(cobj.__doc__) if cobj.__doc__ is not None else {}
             # We then extract the attributes themselves and infer their types from the class objects
-            if cname == "@base":
-                attr_dict = self.config
-            else:
-                attr_dict = _recursive_dd_get(self.config, cname.split("."))
-            for attr_name in dir(cobj):
-                if attr_name.startswith("__"):
-                    continue  # ignore dunderscores
+            prefix = "".join(k + "." for k in _name_to_split[cname])
+            for attr_name in _public_attr_names(cobj):
                 t = type(getattr(cobj, attr_name))
-                attr_dict[attr_name] = ConfigAttr(t.__name__, docstrings[attr_name])
+                self.config[prefix + attr_name] = self._make_config_attr(t.__name__, docstrings.get(attr_name, ""))
                 if t.__module__ != "builtins":
-                    imports.append(f"from {t.__module__} import {t.__name__}")
+                    imports.add(f"from {t.__module__} import {t.__name__}")
             # But we allow for explicit type annotations to override the inferred types
-            for attr_name, t in cobj.__annotations__.items() if hasattr(cobj, "__annotations__") else []:
+            for attr_name, t in _annotations(cobj):
                 # If the type is a class, we use its name, otherwise we have to do some guessing
                 if isinstance(t, type):
                     tname = iname = t.__name__
                 else:
                     tstr = str(t)
                     if tstr.startswith("typing."):
-                        typing_imports += get_typing_imports(t)
-                        tname = type_to_code_str(t)
+                        tname = _annotation_to_code(t, typing_imports.add)
                         iname = None
                     else:
                         tname = iname = tstr
-                attr_dict[attr_name] = ConfigAttr(tname, docstrings[attr_name])
+                self.config[prefix + attr_name] = self._make_config_attr(tname, docstrings.get(attr_name, ""))
                 if t.__module__ != "builtins" and iname is not None:
-                    imports.append(f"from {t.__module__} import {iname}")
-
-        def f(name, d, indentlevel):
-            s = ""
-            s += "    " * indentlevel + f"class {name}:\n"
-            for k, v in sorted(d.items(), key=lambda x: "_" + x[0] if not isinstance(x[1], dict) else x[0]):
-                if isinstance(v, dict):
-                    s += f(k, v, indentlevel + 1)
+                    imports.add(f"from {t.__module__} import {iname}")
+
+        # Group the attributes into nested classes; registered config classes get one even when they are empty
+        tree: Dict[str, Any] = {}
+        for keys in _name_to_split.values():
+            node = tree
+            for k in keys:
+                node = node.setdefault(k, {})
+        for attr_path, attr in self.config.items():
+            *keys, attr_name = attr_path.split(".")
+            node = tree
+            for k in keys:
+                node = node.setdefault(k, {})
+            node[attr_name] = attr
+
+        def f(name, d, indentlevel, out):
+            indent = "    " * (indentlevel + 1)
+            out.append("    " * indentlevel + f"class {name}:\n")
+            # Attributes sort as if prefixed by "_"; the sort key is computed once per item, alongside the type check
+            items = sorted([(k, k, v, True) if isinstance(v, dict) else ("_" + k, k, v, False) for k, v in d.items()])
+            for _, k, v, is_subclass in items:
+                if is_subclass:
+                    f(k, v, indentlevel + 1, out)
                 else:
-                    s += "    " * (indentlevel + 1) + f"{k}: {v.type}\n"
+                    out.append(indent + f"{k}: {v.type}\n")
                     if v.docstring:
-                        s += "    " * (indentlevel + 1) + f'"""{v.docstring}"""\n'
+                        out.append(indent + f'"""{v.docstring}"""\n')
             if not len(d.items()):
                 print(f"Empty config class {name}?")
-                s += "    " * (indentlevel + 1) + "...\n"
-            return s
-
-        s = DISCLAIMER.format(self._base_path)
-        s += f"from typing import {', '.join(sorted(set(typing_imports)))}\n"
-        s += "\n".join(sorted(set(imports))) + "\n\n"
-        s += f("Config", self.config, 0)
-        s += STUB_BASE
+                out.append(indent + "...\n")
+
+        parts = [
+            DISCLAIMER.format(self._base_path),
+            f"from typing import {', '.join(sorted(typing_imports))}\n",
+            "\n".join(sorted(imports)) + "\n\n",
+        ]
+        f("Config", tree, 0, parts)
+        parts.append(STUB_BASE)
+        s = "".join(parts)
         self.stub_path = Path(self._base_path).parent / "config.pyi"
         with open(self.stub_path, "w") as f:
             f.write(s)
@@ -204,33 +397,98 @@ class StubMaker(ast.NodeVisitor):
 
     def visit_ClassDef(self, node):
         for dec in node.decorator_list:
-            if (
-                isinstance(dec, ast.Call)
-                and isinstance(dec.func, ast.Name)
-                and dec.func.id == "config_class"
-                and len(dec.args) == 1
-                and isinstance(dec.args[0], ast.Constant)
-            ):
-                if self._verbose:
-                    print("Found config class", dec.args[0].value)
-                self._should_import = True
-        self.generic_visit(node)
+            if _is_config_decorator(dec):
+                self._found_config(dec.args[0].value)
+        # Only descend into the class if its body has statements that can contain (config) class definitions; bodies
+        # made only of assignments, annotations and expressions can't
+        if any(type(stmt) in _COMPOUND_STMTS for stmt in node.body):
+            self.generic_visit(node)
+
+    def visit_Import(self, node):
+        self._found_imports.extend(alias.name for alias in node.names)
+
+    def visit_ImportFrom(self, node):
+        module = node.module
+        if node.level:
+            # Resolve relative imports against this module's package
+            package = self._module_name().split(".")
+            if self._local_mod_path.name != "__init__.py":
+                package = package[:-1]
+            package = package[: len(package) - node.level + 1]
+            module = ".".join(package + ([module] if module else []))
+        if node.module:
+            self._found_imports.append(module)
+        # `from package import name` may be importing the submodule package.name
+        self._found_imports.extend(f"{module}.{alias.name}" for alias in node.names)
+
+
+def _is_valid_scan_entry(entry: Any) -> bool:
+    # [mtime_ns, size, config class names, imported module names]
+    return (
+        isinstance(entry, list)
+        and len(entry) == 4
+        and all(type(x) is int for x in entry[:2])
+        and all(isinstance(x, list) and all(isinstance(n, str) for n in x) for x in entry[2:])
+    )
+
+
+# Statements whose bodies may contain class definitions, e.g. a config class defined in a method or an if block
+_COMPOUND_STMTS = frozenset(
+    getattr(ast, name)
+    for name in (
+        "ClassDef",
+        "FunctionDef",
+        "AsyncFunctionDef",
+        "If",
+        "For",
+        "AsyncFor",
+        "While",
+        "Try",
+        "TryStar",
+        "With",
+        "AsyncWith",
+        "Match",
+    )
+    if hasattr(ast, name)  # TryStar and Match only exist in recent Pythons
+)
+
+
+def _is_config_decorator(dec: ast.expr) -> bool:
+    # Exact type checks are enough here, ast nodes are never subclassed
+    return (
+        type(dec) is ast.Call
+        and type(dec.func) is ast.Name
+        and dec.func.id == "config_class"
+        and len(dec.args) == 1
+        and type(dec.args[0]) is ast.Constant
+    )
 
 
 _Config_cls: type = None
+# What make_config needs to build a config, derived from the registry on first use: the root class, and the path and
+# class of each subconfig in the order they must be created. Reset whenever the registry or _Config_cls changes.
+_make_config_plan: Optional[Tuple[type, Tuple[Tuple[Tuple[str, ...], type], ...]]] = None
 
 
 def set_Config(cls):
-    global _Config_cls
+    global _Config_cls, _make_config_plan
     _Config_cls = cls
+    _make_config_plan = None
+    _class_snapshots.clear()
+
+
+def _freeze_registry():
+    global _make_config_plan
+    steps = tuple((_name_to_split[cname], cobj) for cname, cobj in sorted(_name_to_config.items()) if cname != "@base")
+    _make_config_plan = (_name_to_config.get("@base", _Config_cls), steps)
+    return _make_config_plan
 
 
 def make_config():
-    config = _name_to_config.get("@base", _Config_cls)()
-    for cname, cobj in sorted(_name_to_config.items()):
-        if cname == "@base":
-            continue
-        _recursive_creative_setattr(config, cname.split("."), _Config_cls, cobj())
+    base, steps = _make_config_plan or _freeze_registry()
+    config = base()
+    for keys, cobj in steps:
+        _recursive_creative_setattr(config, keys, _Config_cls, cobj())
     return config
 
 
@@ -250,9 +508,10 @@ def check_config(config):
     for cname, cobj in _name_to_config.items():
         if cname == "@base":
             continue
-        subcfg = _recursive_getattr(config, cname.split("."))
-        for name, t in cobj.__annotations__.items() if hasattr(cobj, "__annotations__") else []:
-            if not hasattr(subcfg, name):
+        subcfg = _recursive_getattr(config, _name_to_split[cname])
+        present = _present_attr_names(subcfg)
+        for name, t in _annotations(cobj):
+            if name not in present:
                 print(f"Warning, setting {cname}.{name} was declared but not defined in created config")
 
 
@@ -260,19 +519,15 @@ def config_to_dict(config):
     d = {}
     config_classes = tuple(_name_to_config.values()) + (_Config_cls,)
     for cname, _ in _name_to_config.items():
-        if cname == "@base":
-            csplit = []
-            subcfg = config
-        else:
-            csplit = cname.split(".")
-            subcfg = _recursive_getattr(config, csplit)
-        for i in dir(subcfg):
+        csplit = _name_to_split[cname]
+        subcfg = _recursive_getattr(config, csplit)
+        for i in sorted(_present_attr_names(subcfg)):
             if i.startswith("__"):
                 continue
             o = getattr(subcfg, i)
             if isinstance(o, config_classes):
                 continue
-            d[".".join(csplit + [i])] = o
+            d[".".join(csplit + (i,))] = o
     return d
 
 
@@ -280,15 +535,21 @@ def config_class(name):
     assert isinstance(name, str), "config_class decorator must be called with a section name"
 
     def decorator(c):
+        global _make_config_plan
         if name in _name_to_config:
             raise ValueError("Redefining", name, "is not allowed; found", c, "and", _name_to_config[name])
         _name_to_config[name] = c
+        _name_to_split[name] = () if name == "@base" else tuple(name.split("."))
+        _make_config_plan = None
+        _class_snapshots.clear()
         return c
 
     return decorator
 
 
 _name_to_config: dict[str, Any] = {}
+# Registered names pre-split into their dotted path; the "@base" config lives at the root, i.e. the empty path
+_name_to_split: dict[str, tuple[str, ...]] = {}
 if 0:
     if __name__ != "__main__" and hasattr(sys.modules["__main__"], "__main__sentinel"):
         # If we reach this point, config is being imported as a module by another part of the package, while we are running
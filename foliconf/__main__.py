@@ -1,10 +1,14 @@
 from foliconf import *
 import argparse
+import json
+import subprocess
+from pathlib import Path
 
 parser = argparse.ArgumentParser(description="Your script description")
 parser.add_argument("config_path", type=str, help="Path to the configuration file (e.g. src/<package>/config.py)")
 parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose output")
 parser.add_argument("--show_default", "-s", action="store_true", help="Show the default config")
+parser.add_argument("--no_cache", action="store_true", help="Parse every file, ignoring the scan cache")
 
 args = parser.parse_args()
 
@@ -23,17 +27,16 @@ files = (
     .splitlines()
 )
 
-stub_maker = StubMaker(args.config_path, args.verbose)
+stub_maker = StubMaker(args.config_path, args.verbose, None if args.no_cache else default_scan_cache_path(repo))
 for f in files:
     if not f.startswith("src/"):  # Only package files in src/
         continue
     path = Path(repo) / f
     if args.verbose:
         print("Processing", f)
-    root = ast.parse(open(path, "r").read())
-    stub_maker.start_module(path, f)
-    stub_maker.visit(root)
-    stub_maker.finalize_module()
+    stub_maker.scan_module(path, f)
+stub_maker.save_scan_cache()
+stub_maker.finalize_all()
 stub_maker.output_stub()
 subprocess.check_output(f"black {stub_maker.stub_path}", shell=True)  # nosec
 if args.show_default: